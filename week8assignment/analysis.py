@@ -1,107 +1,96 @@
+import argparse
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Headless backend: figures are only written to disk
 import matplotlib.pyplot as plt
 import seaborn as sns
 from wordcloud import WordCloud
-from collections import Counter
-import re
 import streamlit as st
 from datetime import datetime
+from cord19 import IMPORTANT_COLS, read_metadata, clean, cache_is_fresh, load_or_build
 import warnings
 warnings.filterwarnings('ignore')
 
-# Load the metadata
-print("Loading CORD-19 metadata...")
-df = pd.read_csv('metadata.csv')
+# Parquet cache of the cleaned, validated frame (see cord19.load_or_build)
+CLEAN_PARQUET = 'metadata_clean.parquet'
 
-print("=== PART 1: DATA EXPLORATION ===")
+# Characters stripped from titles before counting words. Arrow runs this through RE2, where
+# \w and \s are ASCII-only, so letters, digits and whitespace are spelled as Unicode classes
+PUNCTUATION_PATTERN = r'[^\p{L}\p{N}_\s\v\p{Z}]'
 
-# Examine first few rows
-print("\n1. First few rows:")
-print(df.head())
+def build_clean_data():
+    """Load metadata.csv, explore it and return the cleaned DataFrame"""
+    # Load the metadata
+    print("Loading CORD-19 metadata...")
+    df = read_metadata()
 
-print("\n2. DataFrame dimensions:")
-print(f"Rows: {df.shape[0]}, Columns: {df.shape[1]}")
+    print("=== PART 1: DATA EXPLORATION ===")
 
-print("\n3. Data types:")
-print(df.dtypes)
+    # Examine first few rows
+    print("\n1. First few rows:")
+    print(df.head())
 
-print("\n4. Columns in the dataset:")
-print(df.columns.tolist())
+    print("\n2. DataFrame dimensions:")
+    print(f"Rows: {df.shape[0]}, Columns: {df.shape[1]}")
 
-# Check for missing values
-print("\n5. Missing values in important columns:")
-important_cols = ['title', 'abstract', 'publish_time', 'journal', 'authors', 'doi']
-missing_data = df[important_cols].isnull().sum()
-missing_percent = (missing_data / len(df)) * 100
-missing_df = pd.DataFrame({'Missing Count': missing_data, 'Percentage': missing_percent})
-print(missing_df)
+    print("\n3. Data types:")
+    print(df.dtypes)
 
-print("\n6. Basic statistics for numerical columns:")
-print(df.describe())
+    print("\n4. Columns in the dataset:")
+    print(df.columns.tolist())
 
-# Additional exploration
-print("\n7. Memory usage:")
-print(df.info(memory_usage='deep')) 
+    # Check for missing values
+    print("\n5. Missing values in important columns:")
+    missing_data = df[IMPORTANT_COLS].isnull().sum()
+    missing_percent = (missing_data / len(df)) * 100
+    missing_df = pd.DataFrame({'Missing Count': missing_data, 'Percentage': missing_percent})
+    print(missing_df)
 
-print("\n=== PART 2: DATA CLEANING AND PREPARATION ===")
+    print("\n6. Basic statistics for numerical columns:")
+    print(df.describe())
 
-# Create a copy for cleaning
-df_clean = df.copy()
+    # Additional exploration
+    print("\n7. Memory usage:")
+    print(df.info(memory_usage='deep')) 
 
-print("1. Handling missing values...")
-# Check columns with high missingness
-high_missing_cols = missing_df[missing_df['Percentage'] > 50].index.tolist()
-print(f"Columns with >50% missing values: {high_missing_cols}")
+    print("\n=== PART 2: DATA CLEANING AND PREPARATION ===")
 
-# Fill missing abstracts with empty string, titles with 'Unknown Title'
-df_clean['abstract'] = df_clean['abstract'].fillna('')
-df_clean['title'] = df_clean['title'].fillna('Unknown Title')
+    print("1. Handling missing values...")
+    # Check columns with high missingness
+    high_missing_cols = missing_df[missing_df['Percentage'] > 50].index.tolist()
+    print(f"Columns with >50% missing values: {high_missing_cols}")
 
-# For journals, fill with 'Unknown Journal'
-df_clean['journal'] = df_clean['journal'].fillna('Unknown Journal')
+    print("\n2. Filling missing values, converting dates and counting words...")
+    df_clean = clean(df)
 
-# Convert publish_time to datetime
-print("\n2. Converting date columns...")
-def convert_publish_time(date_str):
-    try:
-        if pd.isna(date_str):
-            return pd.NaT
-        # Handle various date formats
-        if isinstance(date_str, str):
-            # Extract year if it's in format like "2020-03"
-            if len(str(date_str)) == 7 and '-' in str(date_str):
-                return pd.to_datetime(str(date_str) + '-01')
-            # Handle just years
-            elif len(str(date_str)) == 4:
-                return pd.to_datetime(str(date_str) + '-01-01')
-            else:
-                return pd.to_datetime(date_str, errors='coerce')
-        return pd.to_datetime(date_str, errors='coerce')
-    except:
-        return pd.NaT
+    print(f"Date range: {df_clean['publication_year'].min()} - {df_clean['publication_year'].max()}")
+    print(f"Rows after cleaning: {len(df_clean)}")
 
-df_clean['publish_time'] = df_clean['publish_time'].apply(convert_publish_time)
+    # Remove rows with no title or invalid dates
+    initial_count = len(df_clean)
+    df_clean = df_clean.query("title != 'Unknown Title' and publication_year >= 1900")  # Reasonable year filter
+    df_clean = df_clean.assign(
+        # Drop journals that no longer have any papers so the categories are exactly the observed values
+        journal=df_clean['journal'].cat.remove_unused_categories(),
+        # Every remaining row has a valid year, so it fits in int16
+        publication_year=df_clean['publication_year'].astype('int16'),
+    )
 
-# Extract year from publication date
-df_clean['publication_year'] = df_clean['publish_time'].dt.year
+    print(f"Rows after removing invalid entries: {len(df_clean)}")
+    print(f"Removed {initial_count - len(df_clean)} invalid rows")  
 
-# Create abstract word count
-df_clean['abstract_word_count'] = df_clean['abstract'].apply(lambda x: len(str(x).split()))
+    return df_clean
 
-# Create title word count
-df_clean['title_word_count'] = df_clean['title'].apply(lambda x: len(str(x).split()))
+parser = argparse.ArgumentParser(description="Analyze the CORD-19 metadata")
+parser.add_argument('--rebuild', action='store_true',
+                    help=f"ignore {CLEAN_PARQUET} and re-run the exploration and cleaning on metadata.csv")
+args = parser.parse_args()
 
-print(f"Date range: {df_clean['publication_year'].min()} - {df_clean['publication_year'].max()}")
-print(f"Rows after cleaning: {len(df_clean)}")
-
-# Remove rows with no title or invalid dates
-initial_count = len(df_clean)
-df_clean = df_clean[df_clean['title'] != 'Unknown Title']
-df_clean = df_clean[df_clean['publication_year'] >= 1900]  # Reasonable year filter
-
-print(f"Rows after removing invalid entries: {len(df_clean)}")
-print(f"Removed {initial_count - len(df_clean)} invalid rows")  
+if not args.rebuild and cache_is_fresh(CLEAN_PARQUET):
+    print(f"Using cleaned data cached in {CLEAN_PARQUET}; skipping PART 1 (exploration) and PART 2 (cleaning).")
+    print("Run with --rebuild to repeat them on metadata.csv.")
+df_clean = load_or_build(CLEAN_PARQUET, build_clean_data, rebuild=args.rebuild)
 
 print("\n=== PART 3: DATA ANALYSIS AND VISUALIZATION ===")
 
@@ -111,7 +100,11 @@ sns.set_palette("husl")
 
 # 1. Papers by publication year
 print("1. Analyzing papers by publication year...")
-yearly_counts = df_clean['publication_year'].value_counts().sort_index()
+# Years form a small dense range, so count them with one bincount pass instead of hashing
+years = df_clean['publication_year'].to_numpy()
+first_year = years.min()
+year_totals = np.bincount(years - first_year)
+yearly_counts = pd.Series(year_totals, index=np.arange(first_year, first_year + len(year_totals)))
 recent_years = yearly_counts[yearly_counts.index >= 2010]  # Focus on recent years
 
 # 2. Top journals
@@ -121,21 +114,17 @@ top_journals = top_journals[top_journals.index != 'Unknown Journal']
 
 # 3. Most frequent words in titles
 print("3. Analyzing frequent words in titles...")
-def clean_text(text):
-    # Remove special characters and convert to lowercase
-    text = re.sub(r'[^\w\s]', '', str(text))
-    return text.lower()
+# Remove special characters and convert to lowercase, title by title
+cleaned_titles = df_clean['title'].str.lower().str.replace(PUNCTUATION_PATTERN, '', regex=True)
 
-# Get all titles and split into words
-all_titles = ' '.join(df_clean['title'].astype(str))
-cleaned_titles = clean_text(all_titles)
-words = cleaned_titles.split()
+# Split into one word per row
+words = cleaned_titles.str.split().explode().dropna()
 
 # Remove common stop words
-stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'from', 'as', 'that', 'this', 'these', 'those', 'which', 'what', 'when', 'where', 'who', 'whom', 'how', 'why', 'via', 'using', 'based', 'study', 'review', 'analysis', 'covid', '19', 'sars', 'cov', '2', 'coronavirus', 'pandemic'}
-filtered_words = [word for word in words if word not in stop_words and len(word) > 2]
+stop_words = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'from', 'as', 'that', 'this', 'these', 'those', 'which', 'what', 'when', 'where', 'who', 'whom', 'how', 'why', 'via', 'using', 'based', 'study', 'review', 'analysis', 'covid', '19', 'sars', 'cov', '2', 'coronavirus', 'pandemic'})
+filtered_words = words[~words.isin(stop_words) & (words.str.len() > 2)]
 
-word_freq = Counter(filtered_words).most_common(20)
+word_freq = filtered_words.value_counts().head(20)
 
 # Create visualizations
 print("4. Creating visualizations...")
@@ -158,7 +147,7 @@ axes[0,1].set_title('Top 10 Journals by Publication Count', fontsize=14, fontwei
 axes[0,1].set_xlabel('Number of Publications')
 
 # Plot 3: Word frequency
-words, counts = zip(*word_freq)
+words, counts = word_freq.index, word_freq.values
 axes[1,0].bar(range(len(words)), counts)
 axes[1,0].set_xticks(range(len(words)))
 axes[1,0].set_xticklabels(words, rotation=45, ha='right')
@@ -166,7 +155,12 @@ axes[1,0].set_title('Top 20 Words in Paper Titles', fontsize=14, fontweight='bol
 axes[1,0].set_ylabel('Frequency')
 
 # Plot 4: Abstract word count distribution
-axes[1,1].hist(df_clean['abstract_word_count'].clip(0, 500), bins=50, alpha=0.7)
+# Bin the clipped counts with one bincount pass: 50 bins of 10 words, the last one also holding 500
+word_counts = np.clip(df_clean['abstract_word_count'].to_numpy(), 0, 500)
+count_totals = np.bincount(word_counts, minlength=501)
+binned_counts = count_totals[:500].reshape(50, 10).sum(axis=1)
+binned_counts[-1] += count_totals[500]
+axes[1,1].bar(np.arange(0, 500, 10), binned_counts, width=10, align='edge', alpha=0.7)
 axes[1,1].set_title('Distribution of Abstract Word Counts', fontsize=14, fontweight='bold')
 axes[1,1].set_xlabel('Word Count')
 axes[1,1].set_ylabel('Frequency')
@@ -175,8 +169,8 @@ axes[1,1].axvline(df_clean['abstract_word_count'].median(), color='red', linesty
 axes[1,1].legend()
 
 plt.tight_layout()
-plt.savefig('cord19_analysis.png', dpi=300, bbox_inches='tight')
-plt.show()
+plt.savefig('cord19_analysis.png', dpi=150, bbox_inches='tight', pil_kwargs={'compress_level': 1})
+plt.close()
 
 # Word cloud
 print("5. Generating word cloud...")
@@ -187,14 +181,14 @@ plt.imshow(wordcloud, interpolation='bilinear')
 plt.axis('off')
 plt.title('Word Cloud of Paper Titles', fontsize=16, fontweight='bold') 
 plt.tight_layout()
-plt.savefig('wordcloud.png', dpi=300, bbox_inches='tight')
-plt.show()
+plt.savefig('wordcloud.png', dpi=150, bbox_inches='tight', pil_kwargs={'compress_level': 1})
+plt.close()
 
 # Print summary statistics
 print("\n=== SUMMARY STATISTICS ===")
 print(f"Total papers: {len(df_clean)}")
-print(f"Papers with abstracts: {len(df_clean[df_clean['abstract'].str.len() > 0])}")
+print(f"Papers with abstracts: {df_clean['has_abstract'].sum()}")
 print(f"Time span: {df_clean['publication_year'].min()} - {df_clean['publication_year'].max()}")
 print(f"Most recent year: {df_clean['publication_year'].max()} with {yearly_counts.max()} papers")
 print(f"Median abstract length: {df_clean['abstract_word_count'].median()} words")
-print(f"Unique journals: {df_clean['journal'].nunique()}")
\ No newline at end of file
+print(f"Unique journals: {len(df_clean['journal'].cat.categories)}")
\ No newline at end of file
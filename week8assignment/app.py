@@ -1,38 +1,77 @@
 # app.py
 import streamlit as st
+import io
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from wordcloud import WordCloud
-from collections import Counter
-import re
+from wordcloud import WordCloud, STOPWORDS
+from cord19 import CACHE_VERSION, CLEAN_COLS, read_metadata, clean, load_or_build
 
-def load_data():
-    """Load and clean the dataset"""
-    df = pd.read_csv('metadata.csv')
+# Parquet cache of the cleaned frame restricted to 2010 onwards, sorted by year
+CLEAN_PARQUET = 'metadata_app.parquet'
 
-    # Basic cleaning
-    df['abstract'] = df['abstract'].fillna('')
-    df['title'] = df['title'].fillna('Unknown Title')
-    df['journal'] = df['journal'].fillna('Unknown Journal')
-    
-    # Convert dates
-    def convert_date(date_str):
-        try:
-            if pd.isna(date_str):
-                return pd.NaT
-            if isinstance(date_str, str):
-                if len(str(date_str)) == 4:
-                    return pd.to_datetime(str(date_str) + '-01-01')
-            return pd.to_datetime(date_str, errors='coerce')
-        except:
-            return pd.NaT
-    
-    df['publish_time'] = df['publish_time'].apply(convert_date)
-    df['publication_year'] = df['publish_time'].dt.year
-    df = df[df['publication_year'] >= 2010]  # Focus on recent years
-    
-    return df
+# Passed to every cached function: Streamlit only hashes a cached function's own body
+# and arguments, so this is what invalidates them when the shared cleaning changes
+DATA_KEY = (CACHE_VERSION, tuple(CLEAN_COLS))
+
+# The frame and the per-year tables are cached as resources: st.cache_data would unpickle a
+# fresh copy on every call, which costs O(N) per rerun. Callers must treat them as read-only.
+@st.cache_resource(show_spinner=False)
+def load_data(data_key):
+    """Load the cleaned dataset, building it from metadata.csv when the Parquet cache is stale"""
+    def build_data():
+        df = clean(read_metadata())
+        df = df.query('publication_year >= 2010')  # Focus on recent years
+        df = df.astype({'publication_year': 'int16'})
+        # Sorted by year so a year range maps to one contiguous block of rows
+        return df.sort_values('publication_year', kind='stable', ignore_index=True)
+
+    return load_or_build(CLEAN_PARQUET, build_data)
+
+@st.cache_resource(show_spinner=False)
+def per_year_stats(data_key):
+    """Aggregate paper, abstract, non-null and journal counts per publication year"""
+    df = load_data(data_key)
+    by_year = df.groupby('publication_year')
+    year_stats = pd.DataFrame({
+        'papers': by_year.size(),
+        'with_abstract': by_year['has_abstract'].sum(),
+    })
+    non_null_counts = df.notna().groupby(df['publication_year']).sum()
+    journal_counts = df.groupby(['publication_year', 'journal'], observed=True).size()
+    return year_stats, non_null_counts, journal_counts
+
+@st.cache_resource(show_spinner=False)
+def title_word_counts(data_key):
+    """Count title words per publication year, indexed by (publication_year, word)"""
+    df = load_data(data_key)
+    stop_words = pd.Index(['the', 'and', 'for', 'with', 'using', 'based', 'study', 
+                           'review', 'analysis', 'covid', '19', 'sars', 'cov', '2'])
+    titles = df.set_index('publication_year')['title']
+    # Same words as findall(r'\b[a-z]{3,}\b'), but with Arrow kernels instead of a per-title re call:
+    # split into runs of Unicode word characters and keep the all-ASCII ones of 3+ letters
+    words = titles.str.lower().str.split(r'[^\p{L}\p{N}_]+', regex=True).explode()
+    words = words[words.str.fullmatch(r'[a-z]{3,}').fillna(False)].rename('word')
+    word_counts = words.reset_index().value_counts().sort_index()
+    return word_counts.drop(index=stop_words, level='word', errors='ignore')
+
+@st.cache_data(show_spinner=False)
+def compute_word_freq(data_key, year_range):
+    """Count title words for papers published within year_range, most frequent first"""
+    word_counts = title_word_counts(data_key)
+    in_range = word_counts.loc[year_range[0]:year_range[1]]
+    return in_range.groupby(level='word').sum().sort_values(ascending=False)
+
+@st.cache_data(show_spinner=False)
+def make_wordcloud(data_key, year_range):
+    """Render the title word cloud for year_range as PNG bytes"""
+    # generate_from_frequencies skips WordCloud's own stop word removal, so apply it here
+    word_counts = compute_word_freq(data_key, year_range).drop(index=pd.Index(list(STOPWORDS)), errors='ignore')
+    wordcloud = WordCloud(width=400, height=300, background_color='white').generate_from_frequencies(word_counts.to_dict())
+    buffer = io.BytesIO()
+    wordcloud.to_image().save(buffer, format='PNG')
+    return buffer.getvalue()
 
 def main():
     st.set_page_config(page_title="CORD-19 Metadata Analysis", layout="wide")
@@ -45,12 +84,13 @@ def main():
     
     # Load data
     with st.spinner('Loading data...'):
-        df = load_data()
+        df = load_data(DATA_KEY)
+        all_year_stats, non_null_by_year, journal_counts_by_year = per_year_stats(DATA_KEY)
     
     # Sidebar filters
     st.sidebar.header("Filters")
-    min_year = int(df['publication_year'].min())
-    max_year = int(df['publication_year'].max())
+    min_year = int(all_year_stats.index.min())
+    max_year = int(all_year_stats.index.max())
     year_range = st.sidebar.slider(
         "Publication Year Range",
         min_value=min_year,
@@ -58,21 +98,24 @@ def main():
         value=(min_year, max_year)
     )
     
-    # Filter data based on selections
-    filtered_df = df[(df['publication_year'] >= year_range[0]) & 
-                    (df['publication_year'] <= year_range[1])]
+    # Filters select whole years, so summaries add up the small per-year tables
+    year_stats = all_year_stats.reindex(np.arange(year_range[0], year_range[1] + 1), fill_value=0)
+    total_papers = int(year_stats['papers'].sum())
+    journal_counts = (journal_counts_by_year.loc[year_range[0]:year_range[1]]
+                      .groupby(level='journal', observed=True).sum()
+                      .sort_values(ascending=False))
     
     # Main content
     col1, col2 = st.columns(2)
     
     with col1:
-        st.metric("Total Papers", len(filtered_df))
+        st.metric("Total Papers", total_papers)
         st.metric("Papers with Abstracts", 
-                 len(filtered_df[filtered_df['abstract'].str.len() > 0]))
+                 int(year_stats['with_abstract'].sum()))
     
     with col2:
         st.metric("Date Range", f"{year_range[0]} - {year_range[1]}")
-        st.metric("Unique Journals", filtered_df['journal'].nunique())
+        st.metric("Unique Journals", int((journal_counts > 0).sum()))
     
     # Tabs for different analyses
     tab1, tab2, tab3, tab4 = st.tabs(["Publications Over Time", "Top Journals", 
@@ -80,7 +123,7 @@ def main():
     
     with tab1:
         st.subheader("Publications Over Time")
-        yearly_counts = filtered_df['publication_year'].value_counts().sort_index()
+        yearly_counts = year_stats['papers']
         
         fig, ax = plt.subplots(figsize=(10, 6))
         ax.plot(yearly_counts.index, yearly_counts.values, marker='o', linewidth=2)
@@ -93,7 +136,7 @@ def main():
     with tab2:
         st.subheader("Top Publishing Journals")
         top_n = st.slider("Number of journals to show", 5, 20, 10)
-        top_journals = filtered_df['journal'].value_counts().head(top_n)
+        top_journals = journal_counts.head(top_n)
         
         fig, ax = plt.subplots(figsize=(10, 8))
         top_journals.plot(kind='barh', ax=ax)
@@ -105,44 +148,39 @@ def main():
         st.subheader("Title Word Analysis")
         
         # Word frequency
-        all_titles = ' '.join(filtered_df['title'].astype(str))
-        words = re.findall(r'\b[a-z]{3,}\b', all_titles.lower())
-        stop_words = {'the', 'and', 'for', 'with', 'using', 'based', 'study', 
-                     'review', 'analysis', 'covid', '19', 'sars', 'cov', '2'}
-        filtered_words = [word for word in words if word not in stop_words]
-        word_freq = Counter(filtered_words).most_common(15)
+        word_counts = compute_word_freq(DATA_KEY, year_range)
+        word_freq = word_counts.head(15)
         
         # Word cloud
         col1, col2 = st.columns(2)
         
         with col1:
             st.write("**Top 15 Words in Titles**")
-            word_df = pd.DataFrame(word_freq, columns=['Word', 'Frequency'])
+            word_df = word_freq.rename_axis('Word').reset_index(name='Frequency')
             st.dataframe(word_df, height=400)
         
         with col2:
             st.write("**Word Cloud**")
-            wordcloud = WordCloud(width=400, height=300, background_color='white').generate(' '.join(filtered_words))
-            fig, ax = plt.subplots(figsize=(8, 6))
-            ax.imshow(wordcloud, interpolation='bilinear')
-            ax.axis('off')
-            st.pyplot(fig)
+            st.image(make_wordcloud(DATA_KEY, year_range))
     
     with tab4:
         st.subheader("Data Sample")
-        st.write(f"Showing 10 random papers from the dataset ({len(filtered_df)} total):")
+        st.write(f"Showing 10 random papers from the dataset ({total_papers} total):")
         sample_cols = ['title', 'journal', 'publication_year', 'authors']
-        sample_df = filtered_df[sample_cols].sample(min(10, len(filtered_df)))
+        # Rows are sorted by year, so the selected years are the block after all earlier papers
+        first_row = int(all_year_stats.loc[:year_range[0] - 1, 'papers'].sum())
+        sample_rows = first_row + np.random.default_rng().choice(total_papers, size=min(10, total_papers), replace=False)
+        sample_df = df.iloc[sample_rows][sample_cols]
         st.dataframe(sample_df)
         
         # Data summary
         st.subheader("Data Summary")
-        st.write(f"**Dataset Shape:** {filtered_df.shape}")
+        st.write(f"**Dataset Shape:** {(total_papers, df.shape[1])}")
         st.write("**Column Information:**")
         col_info = pd.DataFrame({
-            'Column': filtered_df.columns,
-            'Non-Null Count': filtered_df.notnull().sum(),
-              'Data Type': filtered_df.dtypes.astype(str)
+            'Column': df.columns,
+            'Non-Null Count': non_null_by_year.loc[year_range[0]:year_range[1]].sum(),
+              'Data Type': df.dtypes.astype(str)
         })
         st.dataframe(col_info)
 
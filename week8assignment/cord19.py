@@ -0,0 +1,93 @@
+# cord19.py
+"""Loading and cleaning of the CORD-19 metadata shared by analysis.py and app.py"""
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+# Only the columns used by the analysis are loaded, with compact dtypes
+IMPORTANT_COLS = ['title', 'abstract', 'publish_time', 'journal', 'authors', 'doi']
+ARROW_COLUMN_TYPES = {
+    'title': pa.string(),
+    'abstract': pa.string(),
+    'publish_time': pa.string(),
+    'journal': pa.dictionary(pa.int32(), pa.string()),
+    'authors': pa.string(),
+    'doi': pa.string(),
+}
+
+# Columns produced by clean()
+CLEAN_COLS = IMPORTANT_COLS + ['publication_year', 'abstract_word_count', 'title_word_count', 'has_abstract']
+
+# Stored in every cleaned Parquet file. Bump it (or delete the *.parquet files) whenever
+# clean() or the build steps in analysis.py / app.py change, so stale caches are rebuilt.
+CACHE_VERSION = 2
+_CACHE_VERSION_KEY = b'cord19_cache_version'
+
+def _to_pandas(table):
+    """Convert an Arrow table, keeping strings Arrow-backed and dictionaries categorical"""
+    return table.to_pandas(types_mapper={pa.string(): pd.ArrowDtype(pa.string())}.get)
+
+def read_metadata(path='metadata.csv'):
+    """Read the important metadata columns with PyArrow's multi-threaded CSV parser"""
+    table = pv.read_csv(
+        path,
+        read_options=pv.ReadOptions(block_size=64 << 20),
+        # Abstracts can contain quoted line breaks, which pandas' reader accepted
+        parse_options=pv.ParseOptions(newlines_in_values=True),
+        convert_options=pv.ConvertOptions(include_columns=IMPORTANT_COLS,
+                                          column_types=ARROW_COLUMN_TYPES,
+                                          strings_can_be_null=True)
+    )
+    return _to_pandas(table)
+
+def parse_publish_time(publish_str):
+    """Parse publish_time strings, padding "YYYY" and "YYYY-MM" to full dates"""
+    is_year_only = publish_str.str.len().eq(4)
+    is_year_month = publish_str.str.len().eq(7)
+    publish_str = publish_str.mask(is_year_only, publish_str + '-01-01').mask(is_year_month, publish_str + '-01')
+    return pd.to_datetime(publish_str, errors='coerce', format='mixed')
+
+def word_counts(text):
+    """Count whitespace-separated words like str.split(), with Arrow's Unicode-aware whitespace split"""
+    # Arrow keeps empty tokens at the ends and splits '' into [''], so strip and zero those first
+    stripped = text.str.strip()
+    counts = stripped.str.split().list.len().where(stripped.ne(''), 0)
+    return counts.clip(upper=65535).astype('uint16')
+
+def clean(df):
+    """Fill missing values and derive the date and word count columns in one pass"""
+    return df.assign(
+        abstract=df['abstract'].fillna(''),
+        title=df['title'].fillna('Unknown Title'),
+        journal=df['journal'].cat.add_categories('Unknown Journal').fillna('Unknown Journal'),
+        publish_time=parse_publish_time(df['publish_time']),
+        publication_year=lambda d: d['publish_time'].dt.year,
+        abstract_word_count=lambda d: word_counts(d['abstract']),
+        title_word_count=lambda d: word_counts(d['title']),
+        has_abstract=lambda d: d['abstract'].str.len().gt(0).astype(bool),
+    )
+
+def cache_is_fresh(parquet_path, csv_path='metadata.csv'):
+    """Whether parquet_path was written by this CACHE_VERSION and is not older than the CSV
+
+    A missing CSV (e.g. deleted after the cache was built) leaves only the version check.
+    """
+    if not os.path.exists(parquet_path):
+        return False
+    if os.path.exists(csv_path) and os.path.getmtime(parquet_path) < os.path.getmtime(csv_path):
+        return False
+    metadata = pq.read_schema(parquet_path).metadata or {}
+    return metadata.get(_CACHE_VERSION_KEY) == str(CACHE_VERSION).encode()
+
+def load_or_build(parquet_path, build, rebuild=False):
+    """Load the cleaned frame cached at parquet_path, or call build() and cache its result"""
+    if not rebuild and cache_is_fresh(parquet_path):
+        return _to_pandas(pq.read_table(parquet_path, columns=CLEAN_COLS))
+
+    df = build()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), _CACHE_VERSION_KEY: str(CACHE_VERSION).encode()}
+    pq.write_table(table.replace_schema_metadata(metadata), parquet_path, compression='zstd')
+    return df